@@ -0,0 +1,49 @@
+"""One-off migration: convert created_at values stored as ISO strings into native BSON dates.
+
+Run once per database from the backend directory:
+
+    python migrate_created_at.py
+
+Documents whose created_at cannot be parsed are left untouched and reported.
+"""
+from dotenv import load_dotenv
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+from pathlib import Path
+import os
+import logging
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+COLLECTIONS = ("users", "clients", "services", "invoices", "expenses")
+
+
+def migrate_created_at(db):
+    for collection in COLLECTIONS:
+        try:
+            result = db[collection].update_many(
+                {"created_at": {"$type": "string"}},
+                # onError keeps one malformed value from failing the whole update
+                [{"$set": {"created_at": {"$convert": {
+                    "input": "$created_at", "to": "date", "onError": "$created_at",
+                }}}}],
+            )
+        except PyMongoError as e:
+            logger.error(f"Failed to migrate created_at on {collection}: {str(e)}")
+            continue
+        logger.info(f"Migrated created_at to BSON date on {result.modified_count} {collection}")
+        remaining = db[collection].count_documents({"created_at": {"$type": "string"}})
+        if remaining:
+            logger.warning(f"{remaining} {collection} still have an unparseable created_at string")
+
+
+if __name__ == "__main__":
+    client = MongoClient(os.environ['MONGO_URL'], tz_aware=True)
+    try:
+        migrate_created_at(client[os.environ['DB_NAME']])
+    finally:
+        client.close()
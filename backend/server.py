@@ -1,40 +1,171 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, Response, BackgroundTasks, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import ORJSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import os
 import logging
+import hashlib
+import itertools
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
+import asyncio
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, TypeAdapter
 from typing import List, Optional
 import uuid
 from datetime import datetime, timezone, timedelta
-from passlib.context import CryptContext
+import bcrypt
 import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
 import aiosmtplib
+from jinja2 import Environment, FileSystemLoader, select_autoescape
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Number of uvicorn worker processes. The list, stats, settings and user caches
+# below are per process and only invalidated in the worker that handled the write,
+# so stay on one worker unless those caches move to a shared store.
+WEB_CONCURRENCY = max(1, int(os.environ.get("WEB_CONCURRENCY", 1)))
+CPU_COUNT = os.cpu_count() or 1
+
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# tz_aware so BSON dates come back as UTC-aware datetimes. A warm minimum pool
+# spares cold requests the connection handshake; zstd shrinks documents on the wire.
+# Pool sizes are per process, so split them across workers.
+client = AsyncIOMotorClient(
+    mongo_url,
+    tz_aware=True,
+    maxPoolSize=max(10, 200 // WEB_CONCURRENCY),
+    minPoolSize=max(1, 20 // WEB_CONCURRENCY),
+    waitQueueTimeoutMS=2000,
+    serverSelectionTimeoutMS=3000,
+    compressors="zstd",
+    retryWrites=True,
+)
 db = client[os.environ['DB_NAME']]
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 api_router = APIRouter(prefix="/api")
 
+# "a, b" must yield "b", not " b", or the origin never matches
+CORS_ORIGINS = list(dict.fromkeys(
+    origin.strip() for origin in os.environ.get('CORS_ORIGINS', '*').split(',') if origin.strip()
+))
+
 SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "imagicity-secret-key-2024")
-ALGORITHM = "HS256"
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+ALGORITHM = "EdDSA"
+# Tokens issued before the switch to EdDSA stay valid until they expire
+LEGACY_ALGORITHM = "HS256"
+
+def load_legacy_token_cutoff() -> Optional[datetime]:
+    """JWT_LEGACY_CUTOFF (ISO 8601) is set at deploy time to the deploy instant plus the
+    30-day token lifetime; HS256 tokens expiring later were minted after the switch"""
+    cutoff = os.environ.get("JWT_LEGACY_CUTOFF")
+    if not cutoff:
+        return None
+    cutoff = datetime.fromisoformat(cutoff)
+    return cutoff if cutoff.tzinfo else cutoff.replace(tzinfo=timezone.utc)
+
+LEGACY_TOKEN_CUTOFF = load_legacy_token_cutoff()
+
+def load_jwt_signing_key() -> Ed25519PrivateKey:
+    private_pem = os.environ.get("JWT_PRIVATE_KEY")
+    if private_pem:
+        return serialization.load_pem_private_key(private_pem.encode(), password=None)
+    # Fallback only: derived from the shared secret so every worker and restart agree,
+    # but anyone holding JWT_SECRET_KEY can then mint tokens (warned about at startup)
+    return Ed25519PrivateKey.from_private_bytes(hashlib.sha256(SECRET_KEY.encode()).digest())
+
+JWT_SIGNING_KEY = load_jwt_signing_key()
+JWT_VERIFYING_KEY = JWT_SIGNING_KEY.public_key()
+BCRYPT_ROUNDS = 10
+# Dedicated pool so password hashing never starves the shared default executor;
+# sized so all workers together run about two hashing threads per core
+BCRYPT_WORKERS = max(1, 2 * CPU_COUNT // WEB_CONCURRENCY)
+BCRYPT_MAX_PENDING = BCRYPT_WORKERS * 4
+bcrypt_pool = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+bcrypt_pending = 0
 security = HTTPBearer()
+# Templates are compiled once and never re-checked on disk; autoescaping keeps
+# client-supplied text out of the markup
+email_templates = Environment(
+    loader=FileSystemLoader(ROOT_DIR / "templates"),
+    autoescape=select_autoescape(["html"]),
+    auto_reload=False,
+)
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
+class TTLCache:
+    """Small in-process LRU cache whose entries expire after a TTL (seconds)"""
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: float = None):
+        self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+
+# Caches below live per process and are invalidated locally on write, which is only
+# coherent with a single worker (see WEB_CONCURRENCY). The token cache is the exception:
+# a verified JWT stays valid whichever worker sees it.
+# Verified JWTs -> user_id, so repeat requests skip signature check and JSON decode
+token_cache = TTLCache(maxsize=10000, ttl=300)
+# user_id -> User, populated at signup/login so /auth/me avoids a Mongo round trip
+user_cache = TTLCache(maxsize=10000, ttl=3600)
+# (resource, user_id, generation, query variant) -> list response. Each page is its own
+# entry, so it expires on its own and counts against maxsize
+list_cache = TTLCache(maxsize=10000, ttl=60)
+# (resource, user_id) -> generation embedded in that user's list_cache keys. Writes drop it,
+# and the next read draws a never-before-used number, orphaning every cached page at once
+list_generations = TTLCache(maxsize=10000, ttl=3600)
+list_generation_counter = itertools.count()
+# user_id -> dashboard stats, dropped on any client/invoice/expense write that changes them
+stats_cache = TTLCache(maxsize=10000, ttl=60)
+# user_id -> company/bank settings used to render emails, dropped on settings update
+settings_cache = TTLCache(maxsize=10000, ttl=300)
+
+# Fields the list views actually render; full documents stay available per item
+INVOICE_SUMMARY_PROJECTION = {
+    "_id": 0, "id": 1, "invoice_number": 1, "invoice_date": 1, "due_date": 1, "total": 1,
+    "status": 1, "client_id": 1, "invoice_type": 1, "created_at": 1,
+}
+CLIENT_SUMMARY_PROJECTION = {"_id": 0, "id": 1, "name": 1, "business_name": 1, "email": 1}
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
 # Models
 class UserCreate(BaseModel):
     email: EmailStr
@@ -47,10 +178,10 @@ class UserLogin(BaseModel):
 
 class User(BaseModel):
     model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
     email: str
     name: str
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: datetime = Field(default_factory=utcnow)
 
 class Token(BaseModel):
     access_token: str
@@ -69,7 +200,7 @@ class ClientCreate(BaseModel):
 
 class Client(BaseModel):
     model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
     name: str
     business_name: Optional[str] = None
     email: Optional[str] = None
@@ -78,7 +209,7 @@ class Client(BaseModel):
     country: Optional[str] = None
     address: Optional[str] = None
     business_address: Optional[str] = None
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: datetime = Field(default_factory=utcnow)
     user_id: str
 
 class ServiceCreate(BaseModel):
@@ -90,16 +221,17 @@ class ServiceCreate(BaseModel):
 
 class Service(BaseModel):
     model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
     name: str
     description: Optional[str] = None
     price: float
     gst_type: str
     gst_percentage: float
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: datetime = Field(default_factory=utcnow)
     user_id: str
 
 class InvoiceItem(BaseModel):
+    model_config = ConfigDict(extra="ignore")
     description: str
     quantity: float
     rate: float
@@ -122,7 +254,7 @@ class InvoiceCreate(BaseModel):
 
 class Invoice(BaseModel):
     model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
     invoice_number: str
     client_id: str
     invoice_date: str
@@ -137,9 +269,15 @@ class Invoice(BaseModel):
     invoice_type: str
     is_recurring: bool
     notes: Optional[str] = None
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: datetime = Field(default_factory=utcnow)
     user_id: str
 
+# Upper bound on one send-batch request, which holds the shared SMTP session throughout
+MAX_EMAIL_BATCH = 100
+
+class InvoiceEmailBatch(BaseModel):
+    invoice_ids: List[str] = Field(..., max_length=MAX_EMAIL_BATCH)
+
 class ExpenseCreate(BaseModel):
     date: str
     description: str
@@ -148,17 +286,20 @@ class ExpenseCreate(BaseModel):
 
 class Expense(BaseModel):
     model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
     date: str
     description: str
     amount: float
     category: str
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: datetime = Field(default_factory=utcnow)
     user_id: str
 
+# Built once so list validation and JSON dumping run entirely in pydantic-core
+EXPENSE_LIST_ADAPTER = TypeAdapter(List[Expense])
+
 class Settings(BaseModel):
     model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
     user_id: str
     invoice_prefix: str = "INV"
     invoice_counter: int = 1
@@ -172,29 +313,127 @@ class Settings(BaseModel):
 
 
 # Helper functions
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+async def run_bcrypt(func, *args):
+    """Run a bcrypt call on the dedicated pool, shedding load once the queue is full"""
+    global bcrypt_pending
+    if bcrypt_pending >= BCRYPT_MAX_PENDING:
+        logger.warning(f"bcrypt queue saturated ({bcrypt_pending} pending), rejecting request")
+        raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
+    bcrypt_pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(bcrypt_pool, func, *args)
+    finally:
+        bcrypt_pending -= 1
+
+async def hash_password(password: str) -> str:
+    hashed = await run_bcrypt(bcrypt.hashpw, password.encode(), bcrypt.gensalt(BCRYPT_ROUNDS))
+    return hashed.decode()
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    if not hashed_password:
+        return False
+    try:
+        return await run_bcrypt(bcrypt.checkpw, plain_password.encode(), hashed_password.encode())
+    except ValueError:
+        return False
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+def password_needs_rehash(hashed_password: str) -> bool:
+    # bcrypt hashes look like $2b$<rounds>$<salt+hash>
+    try:
+        return int(hashed_password.split('$')[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
+
+def list_cache_key(resource: str, user_id: str, variant=None):
+    generation = list_generations.get((resource, user_id))
+    if generation is None:
+        generation = next(list_generation_counter)
+        list_generations.set((resource, user_id), generation)
+    return (resource, user_id, generation, variant)
+
+def get_cached_list(resource: str, user_id: str, variant=None):
+    return list_cache.get(list_cache_key(resource, user_id, variant))
+
+def set_cached_list(resource: str, user_id: str, docs: list, variant=None):
+    list_cache.set(list_cache_key(resource, user_id, variant), docs)
+
+def invalidate_list_cache(resource: str, user_id: str):
+    list_generations.delete((resource, user_id))
+
+def invalidate_dashboard_stats(user_id: str):
+    stats_cache.delete(user_id)
+
+async def get_email_settings(user_id: str) -> dict:
+    """Settings needed to render emails, served from cache when possible"""
+    settings = settings_cache.get(user_id)
+    if settings is None:
+        # invoice_counter changes on every invoice, so keep it out of the cached copy
+        settings = await db.settings.find_one({"user_id": user_id}, {"_id": 0, "invoice_counter": 0})
+        if not settings:
+            # Defaults get created later (get_settings, first invoice); don't pin the miss
+            return {}
+        settings_cache.set(user_id, settings)
+    return settings
+
+async def fetch_clients_by_id(user_id: str, client_ids, projection: dict = CLIENT_SUMMARY_PROJECTION) -> dict:
+    """Load many of the user's clients in a single $in query, keyed by id"""
+    client_ids = list(set(client_ids))
+    if not client_ids:
+        return {}
+    # Scoped to the owner: client_id on an invoice is caller-supplied and never verified
+    clients = await db.clients.find({"user_id": user_id, "id": {"$in": client_ids}}, projection).to_list(len(client_ids))
+    return {client["id"]: client for client in clients}
+
+async def reserve_invoice_number(user_id: str) -> str:
+    """Atomically take the next invoice number from the user's settings"""
+    settings_doc = await db.settings.find_one_and_update(
+        {"user_id": user_id},
+        {"$inc": {"invoice_counter": 1}},
+        projection={"_id": 0, "invoice_prefix": 1, "invoice_counter": 1},
+        return_document=ReturnDocument.BEFORE,
+    )
+    if not settings_doc:
+        # No settings yet: create defaults with the first number already taken
+        settings_doc = Settings(user_id=user_id).model_dump()
+        try:
+            await db.settings.insert_one({**settings_doc, "invoice_counter": settings_doc['invoice_counter'] + 1})
+        except DuplicateKeyError:
+            return await reserve_invoice_number(user_id)
+    return f"{settings_doc['invoice_prefix']}-{settings_doc['invoice_counter']:04d}"
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     if expires_delta:
-        expire = datetime.now(timezone.utc) + expires_delta
+        expire = utcnow() + expires_delta
     else:
-        expire = datetime.now(timezone.utc) + timedelta(days=30)
+        expire = utcnow() + timedelta(days=30)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt.encode(to_encode, JWT_SIGNING_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def decode_access_token(token: str) -> dict:
+    if jwt.get_unverified_header(token).get("alg") == LEGACY_ALGORITHM:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[LEGACY_ALGORITHM], options={"require": ["exp"]})
+        if LEGACY_TOKEN_CUTOFF and payload["exp"] > LEGACY_TOKEN_CUTOFF.timestamp():
+            raise jwt.InvalidTokenError("HS256 token issued after the EdDSA switch")
+        return payload
+    return jwt.decode(token, JWT_VERIFYING_KEY, algorithms=[ALGORITHM])
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
+    token = credentials.credentials
+    cached_user_id = token_cache.get(token)
+    if cached_user_id is not None:
+        return cached_user_id
     try:
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_access_token(token)
         user_id: str = payload.get("sub")
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+        # Never cache a token past its own expiry
+        ttl = min(token_cache.ttl, payload["exp"] - time.time()) if "exp" in payload else token_cache.ttl
+        if ttl > 0:
+            token_cache.set(token, user_id, ttl=ttl)
         return user_id
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
@@ -215,35 +454,54 @@ async def signup(user_data: UserCreate):
     
     user = User(email=user_data.email, name=user_data.name)
     user_dict = user.model_dump()
-    user_dict['password_hash'] = hash_password(user_data.password)
-    user_dict['created_at'] = user_dict['created_at'].isoformat()
+    user_dict['password_hash'] = await hash_password(user_data.password)
     
-    await db.users.insert_one(user_dict)
+    try:
+        await db.users.insert_one(user_dict)
+    except DuplicateKeyError:
+        # A concurrent signup with the same email won the race past the check above
+        raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create default settings
     settings = Settings(user_id=user.id)
     settings_dict = settings.model_dump()
     await db.settings.insert_one(settings_dict)
     
+    user_cache.set(user.id, user)
     access_token = create_access_token(data={"sub": user.id})
     return Token(access_token=access_token, user=user)
 
 @api_router.post("/auth/login", response_model=Token)
 async def login(credentials: UserLogin):
     user_doc = await db.users.find_one({"email": credentials.email}, {"_id": 0})
-    if not user_doc or not verify_password(credentials.password, user_doc.get('password_hash', '')):
+    if not user_doc or not await verify_password(credentials.password, user_doc.get('password_hash', '')):
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
+    # Upgrade hashes created with a different cost factor. Best effort: the password is
+    # already verified, so a busy bcrypt pool or a failed write must not fail the login
+    if password_needs_rehash(user_doc['password_hash']):
+        try:
+            new_hash = await hash_password(credentials.password)
+            await db.users.update_one({"id": user_doc['id']}, {"$set": {"password_hash": new_hash}})
+        except Exception as e:
+            logger.warning(f"Failed to rehash password for user {user_doc['id']}: {str(e)}")
+    
     user = User(**{k: v for k, v in user_doc.items() if k != 'password_hash'})
+    user_cache.set(user.id, user)
     access_token = create_access_token(data={"sub": user.id})
     return Token(access_token=access_token, user=user)
 
 @api_router.get("/auth/me", response_model=User)
 async def get_me(user_id: str = Depends(get_current_user)):
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
     user_doc = await db.users.find_one({"id": user_id}, {"_id": 0, "password_hash": 0})
     if not user_doc:
         raise HTTPException(status_code=404, detail="User not found")
-    return User(**user_doc)
+    user = User(**user_doc)
+    user_cache.set(user_id, user)
+    return user
 
 
 # Client routes
@@ -251,39 +509,42 @@ async def get_me(user_id: str = Depends(get_current_user)):
 async def create_client(client_data: ClientCreate, user_id: str = Depends(get_current_user)):
     client = Client(**client_data.model_dump(), user_id=user_id)
     client_dict = client.model_dump()
-    client_dict['created_at'] = client_dict['created_at'].isoformat()
     await db.clients.insert_one(client_dict)
+    invalidate_list_cache("clients", user_id)
+    invalidate_dashboard_stats(user_id)
     return client
 
-@api_router.get("/clients", response_model=List[Client])
-async def get_clients(user_id: str = Depends(get_current_user)):
-    clients = await db.clients.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
-    for client in clients:
-        if isinstance(client.get('created_at'), str):
-            client['created_at'] = datetime.fromisoformat(client['created_at'])
-    return clients
+@api_router.get("/clients", response_class=ORJSONResponse)
+async def get_clients(summary: bool = False, user_id: str = Depends(get_current_user)):
+    # Stored documents are already JSON-shaped, so skip response_model revalidation
+    cached = get_cached_list("clients", user_id, summary)
+    if cached is not None:
+        return ORJSONResponse(cached)
+    projection = CLIENT_SUMMARY_PROJECTION if summary else {"_id": 0}
+    clients = await db.clients.find({"user_id": user_id}, projection).to_list(1000)
+    set_cached_list("clients", user_id, clients, summary)
+    return ORJSONResponse(clients)
 
 @api_router.get("/clients/{client_id}", response_model=Client)
 async def get_client(client_id: str, user_id: str = Depends(get_current_user)):
     client = await db.clients.find_one({"id": client_id, "user_id": user_id}, {"_id": 0})
     if not client:
         raise HTTPException(status_code=404, detail="Client not found")
-    if isinstance(client.get('created_at'), str):
-        client['created_at'] = datetime.fromisoformat(client['created_at'])
     return Client(**client)
 
 @api_router.put("/clients/{client_id}", response_model=Client)
 async def update_client(client_id: str, client_data: ClientCreate, user_id: str = Depends(get_current_user)):
-    existing = await db.clients.find_one({"id": client_id, "user_id": user_id}, {"_id": 0})
-    if not existing:
+    updated_client = await db.clients.find_one_and_update(
+        {"id": client_id, "user_id": user_id},
+        {"$set": client_data.model_dump()},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+    )
+    if not updated_client:
         raise HTTPException(status_code=404, detail="Client not found")
-    
-    update_data = client_data.model_dump()
-    await db.clients.update_one({"id": client_id, "user_id": user_id}, {"$set": update_data})
-    
-    updated_client = await db.clients.find_one({"id": client_id}, {"_id": 0})
-    if isinstance(updated_client.get('created_at'), str):
-        updated_client['created_at'] = datetime.fromisoformat(updated_client['created_at'])
+    invalidate_list_cache("clients", user_id)
+    # Cached invoice lists may embed this client via expand=client
+    invalidate_list_cache("invoices", user_id)
     return Client(**updated_client)
 
 @api_router.delete("/clients/{client_id}")
@@ -291,6 +552,9 @@ async def delete_client(client_id: str, user_id: str = Depends(get_current_user)
     result = await db.clients.delete_one({"id": client_id, "user_id": user_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Client not found")
+    invalidate_list_cache("clients", user_id)
+    invalidate_list_cache("invoices", user_id)
+    invalidate_dashboard_stats(user_id)
     return {"message": "Client deleted successfully"}
 
 
@@ -299,39 +563,38 @@ async def delete_client(client_id: str, user_id: str = Depends(get_current_user)
 async def create_service(service_data: ServiceCreate, user_id: str = Depends(get_current_user)):
     service = Service(**service_data.model_dump(), user_id=user_id)
     service_dict = service.model_dump()
-    service_dict['created_at'] = service_dict['created_at'].isoformat()
     await db.services.insert_one(service_dict)
+    invalidate_list_cache("services", user_id)
     return service
 
-@api_router.get("/services", response_model=List[Service])
+@api_router.get("/services", response_class=ORJSONResponse)
 async def get_services(user_id: str = Depends(get_current_user)):
+    # Stored documents are already JSON-shaped, so skip response_model revalidation
+    cached = get_cached_list("services", user_id)
+    if cached is not None:
+        return ORJSONResponse(cached)
     services = await db.services.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
-    for service in services:
-        if isinstance(service.get('created_at'), str):
-            service['created_at'] = datetime.fromisoformat(service['created_at'])
-    return services
+    set_cached_list("services", user_id, services)
+    return ORJSONResponse(services)
 
 @api_router.get("/services/{service_id}", response_model=Service)
 async def get_service(service_id: str, user_id: str = Depends(get_current_user)):
     service = await db.services.find_one({"id": service_id, "user_id": user_id}, {"_id": 0})
     if not service:
         raise HTTPException(status_code=404, detail="Service not found")
-    if isinstance(service.get('created_at'), str):
-        service['created_at'] = datetime.fromisoformat(service['created_at'])
     return Service(**service)
 
 @api_router.put("/services/{service_id}", response_model=Service)
 async def update_service(service_id: str, service_data: ServiceCreate, user_id: str = Depends(get_current_user)):
-    existing = await db.services.find_one({"id": service_id, "user_id": user_id}, {"_id": 0})
-    if not existing:
+    updated_service = await db.services.find_one_and_update(
+        {"id": service_id, "user_id": user_id},
+        {"$set": service_data.model_dump()},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+    )
+    if not updated_service:
         raise HTTPException(status_code=404, detail="Service not found")
-    
-    update_data = service_data.model_dump()
-    await db.services.update_one({"id": service_id, "user_id": user_id}, {"$set": update_data})
-    
-    updated_service = await db.services.find_one({"id": service_id}, {"_id": 0})
-    if isinstance(updated_service.get('created_at'), str):
-        updated_service['created_at'] = datetime.fromisoformat(updated_service['created_at'])
+    invalidate_list_cache("services", user_id)
     return Service(**updated_service)
 
 @api_router.delete("/services/{service_id}")
@@ -339,6 +602,7 @@ async def delete_service(service_id: str, user_id: str = Depends(get_current_use
     result = await db.services.delete_one({"id": service_id, "user_id": user_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Service not found")
+    invalidate_list_cache("services", user_id)
     return {"message": "Service deleted successfully"}
 
 
@@ -346,59 +610,61 @@ async def delete_service(service_id: str, user_id: str = Depends(get_current_use
 # Invoice routes
 @api_router.post("/invoices", response_model=Invoice)
 async def create_invoice(invoice_data: InvoiceCreate, user_id: str = Depends(get_current_user)):
-    # Get settings to generate invoice number
-    settings_doc = await db.settings.find_one({"user_id": user_id}, {"_id": 0})
-    if not settings_doc:
-        settings = Settings(user_id=user_id)
-        settings_dict = settings.model_dump()
-        await db.settings.insert_one(settings_dict)
-        settings_doc = settings_dict
-    
-    invoice_number = f"{settings_doc['invoice_prefix']}-{settings_doc['invoice_counter']:04d}"
+    invoice_number = await reserve_invoice_number(user_id)
     
     invoice = Invoice(**invoice_data.model_dump(), invoice_number=invoice_number, user_id=user_id)
     invoice_dict = invoice.model_dump()
-    invoice_dict['created_at'] = invoice_dict['created_at'].isoformat()
     
     await db.invoices.insert_one(invoice_dict)
-    
-    # Increment counter
-    await db.settings.update_one(
-        {"user_id": user_id},
-        {"$inc": {"invoice_counter": 1}}
-    )
+    invalidate_list_cache("invoices", user_id)
+    invalidate_dashboard_stats(user_id)
     
     return invoice
 
-@api_router.get("/invoices", response_model=List[Invoice])
-async def get_invoices(user_id: str = Depends(get_current_user)):
-    invoices = await db.invoices.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
-    for invoice in invoices:
-        if isinstance(invoice.get('created_at'), str):
-            invoice['created_at'] = datetime.fromisoformat(invoice['created_at'])
-    return invoices
+@api_router.get("/invoices", response_class=ORJSONResponse)
+async def get_invoices(
+    summary: bool = False,
+    expand: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    user_id: str = Depends(get_current_user),
+):
+    if expand not in (None, "client"):
+        raise HTTPException(status_code=400, detail="Unsupported expand value")
+    # Stored documents are already JSON-shaped, so skip response_model revalidation
+    variant = (summary, expand, limit, offset)
+    cached = get_cached_list("invoices", user_id, variant)
+    if cached is not None:
+        return ORJSONResponse(cached)
+    projection = INVOICE_SUMMARY_PROJECTION if summary else {"_id": 0}
+    # Newest first, served by the (user_id, created_at, id) index
+    invoices = await db.invoices.find({"user_id": user_id}, projection).sort([("created_at", -1), ("id", -1)]).skip(offset).limit(limit).to_list(limit)
+    if expand == "client":
+        clients = await fetch_clients_by_id(user_id, (invoice["client_id"] for invoice in invoices))
+        for invoice in invoices:
+            invoice["client"] = clients.get(invoice["client_id"])
+    set_cached_list("invoices", user_id, invoices, variant)
+    return ORJSONResponse(invoices)
 
 @api_router.get("/invoices/{invoice_id}", response_model=Invoice)
 async def get_invoice(invoice_id: str, user_id: str = Depends(get_current_user)):
     invoice = await db.invoices.find_one({"id": invoice_id, "user_id": user_id}, {"_id": 0})
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
-    if isinstance(invoice.get('created_at'), str):
-        invoice['created_at'] = datetime.fromisoformat(invoice['created_at'])
     return Invoice(**invoice)
 
 @api_router.put("/invoices/{invoice_id}", response_model=Invoice)
 async def update_invoice(invoice_id: str, invoice_data: InvoiceCreate, user_id: str = Depends(get_current_user)):
-    existing = await db.invoices.find_one({"id": invoice_id, "user_id": user_id}, {"_id": 0})
-    if not existing:
+    updated_invoice = await db.invoices.find_one_and_update(
+        {"id": invoice_id, "user_id": user_id},
+        {"$set": invoice_data.model_dump()},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+    )
+    if not updated_invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
-    
-    update_data = invoice_data.model_dump()
-    await db.invoices.update_one({"id": invoice_id, "user_id": user_id}, {"$set": update_data})
-    
-    updated_invoice = await db.invoices.find_one({"id": invoice_id}, {"_id": 0})
-    if isinstance(updated_invoice.get('created_at'), str):
-        updated_invoice['created_at'] = datetime.fromisoformat(updated_invoice['created_at'])
+    invalidate_list_cache("invoices", user_id)
+    invalidate_dashboard_stats(user_id)
     return Invoice(**updated_invoice)
 
 @api_router.delete("/invoices/{invoice_id}")
@@ -406,461 +672,172 @@ async def delete_invoice(invoice_id: str, user_id: str = Depends(get_current_use
     result = await db.invoices.delete_one({"id": invoice_id, "user_id": user_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Invoice not found")
+    invalidate_list_cache("invoices", user_id)
+    invalidate_dashboard_stats(user_id)
     return {"message": "Invoice deleted successfully"}
 
 
 @api_router.post("/invoices/{invoice_id}/convert-to-invoice")
 async def convert_quotation_to_invoice(invoice_id: str, user_id: str = Depends(get_current_user)):
     """Convert a quotation to an invoice"""
-    quotation = await db.invoices.find_one({"id": invoice_id, "user_id": user_id, "invoice_type": "quotation"}, {"_id": 0})
+    quotation = await db.invoices.find_one({"id": invoice_id, "user_id": user_id, "invoice_type": "quotation"}, {"_id": 1})
     if not quotation:
         raise HTTPException(status_code=404, detail="Quotation not found")
     
-    # Get settings to generate new invoice number
-    settings_doc = await db.settings.find_one({"user_id": user_id}, {"_id": 0})
-    invoice_number = f"{settings_doc['invoice_prefix']}-{settings_doc['invoice_counter']:04d}"
+    invoice_number = await reserve_invoice_number(user_id)
     
     # Update quotation to invoice
-    await db.invoices.update_one(
-        {"id": invoice_id},
-        {"$set": {"invoice_type": "invoice", "invoice_number": invoice_number}}
-    )
-    
-    # Increment counter
-    await db.settings.update_one(
-        {"user_id": user_id},
-        {"$inc": {"invoice_counter": 1}}
+    updated_invoice = await db.invoices.find_one_and_update(
+        {"id": invoice_id, "user_id": user_id, "invoice_type": "quotation"},
+        {"$set": {"invoice_type": "invoice", "invoice_number": invoice_number}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
     )
-    
-    updated_invoice = await db.invoices.find_one({"id": invoice_id}, {"_id": 0})
-    if isinstance(updated_invoice.get('created_at'), str):
-        updated_invoice['created_at'] = datetime.fromisoformat(updated_invoice['created_at'])
+    if not updated_invoice:
+        raise HTTPException(status_code=404, detail="Quotation not found")
+    invalidate_list_cache("invoices", user_id)
     return Invoice(**updated_invoice)
 
+def build_email_message(to_email: str, subject: str, html_content: str) -> MIMEMultipart:
+    from_email = os.environ.get('SMTP_FROM_EMAIL')
+    from_name = os.environ.get('SMTP_FROM_NAME', 'IMAGICITY')
+    
+    message = MIMEMultipart('alternative')
+    message['Subject'] = subject
+    message['From'] = f"{from_name} <{from_email}>"
+    message['To'] = to_email
+    message.attach(MIMEText(html_content, 'html'))
+    return message
+
+def smtp_connection_kwargs() -> dict:
+    return {
+        "hostname": os.environ.get('SMTP_HOST', 'smtp.gmail.com'),
+        "port": int(os.environ.get('SMTP_PORT', 587)),
+        "username": os.environ.get('SMTP_USER'),
+        "password": os.environ.get('SMTP_PASSWORD'),
+        "start_tls": True,
+    }
+
+class SMTPClient:
+    """Long-lived SMTP session shared by all sends, so TLS and AUTH happen once"""
+    def __init__(self):
+        self._smtp = None
+        self._lock = asyncio.Lock()
+
+    async def connect(self):
+        # connect() also runs STARTTLS and login with the configured credentials
+        self._smtp = aiosmtplib.SMTP(**smtp_connection_kwargs())
+        await self._smtp.connect()
+
+    async def send_message(self, message: MIMEMultipart):
+        async with self._lock:
+            if self._smtp is None or not self._smtp.is_connected:
+                await self.connect()
+            try:
+                return await self._smtp.send_message(message)
+            except aiosmtplib.SMTPServerDisconnected:
+                # Servers drop idle sessions; reconnect once and retry
+                await self.connect()
+                return await self._smtp.send_message(message)
+
+    async def close(self):
+        async with self._lock:
+            if self._smtp is not None and self._smtp.is_connected:
+                try:
+                    await self._smtp.quit()
+                except aiosmtplib.SMTPException:
+                    self._smtp.close()
+            self._smtp = None
+
+smtp_client = SMTPClient()
+
 async def send_email_smtp(to_email: str, subject: str, html_content: str):
     """Send email using Gmail SMTP"""
+    # Runs as a background task after the response has gone out, so failures
+    # can only be logged
     try:
-        smtp_host = os.environ.get('SMTP_HOST', 'smtp.gmail.com')
-        smtp_port = int(os.environ.get('SMTP_PORT', 587))
-        smtp_user = os.environ.get('SMTP_USER')
-        smtp_password = os.environ.get('SMTP_PASSWORD')
-        from_email = os.environ.get('SMTP_FROM_EMAIL')
-        from_name = os.environ.get('SMTP_FROM_NAME', 'IMAGICITY')
-        
-        # Create message
-        message = MIMEMultipart('alternative')
-        message['Subject'] = subject
-        message['From'] = f"{from_name} <{from_email}>"
-        message['To'] = to_email
-        
-        # Attach HTML content
-        html_part = MIMEText(html_content, 'html')
-        message.attach(html_part)
-        
-        # Send email
-        await aiosmtplib.send(
-            message,
-            hostname=smtp_host,
-            port=smtp_port,
-            username=smtp_user,
-            password=smtp_password,
-            start_tls=True,
-        )
-        
+        message = build_email_message(to_email, subject, html_content)
+        await smtp_client.send_message(message)
         return True
     except Exception as e:
-        logger.error(f"Failed to send email: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Failed to send email: {str(e)}")
+        logger.error(f"Failed to send email to {to_email}: {str(e)}")
+        return False
 
-@api_router.post("/invoices/{invoice_id}/send-email")
-async def send_invoice_email(invoice_id: str, user_id: str = Depends(get_current_user)):
+INVOICE_EMAIL_TEMPLATE = email_templates.get_template("invoice_email.html")
+
+def render_invoice_email(invoice: dict, client: dict, settings: dict):
+    """Build the subject and HTML body for an invoice email"""
+    invoice_type = invoice.get("invoice_type", "invoice").title()
+    subject = f"{invoice_type} {invoice['invoice_number']} from IMAGICITY"
+    html_content = INVOICE_EMAIL_TEMPLATE.render(
+        invoice=invoice, client=client, settings=settings, invoice_type=invoice_type
+    )
+    return subject, html_content
+
+@api_router.post("/invoices/{invoice_id}/send-email", status_code=202)
+async def send_invoice_email(invoice_id: str, background_tasks: BackgroundTasks, user_id: str = Depends(get_current_user)):
     """Send invoice via email"""
     invoice = await db.invoices.find_one({"id": invoice_id, "user_id": user_id}, {"_id": 0})
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
     
-    client = await db.clients.find_one({"id": invoice["client_id"]}, {"_id": 0})
+    client = await db.clients.find_one({"id": invoice["client_id"], "user_id": user_id}, {"_id": 0})
     if not client or not client.get("email"):
         raise HTTPException(status_code=400, detail="Client email not found")
     
-    settings = await db.settings.find_one({"user_id": user_id}, {"_id": 0})
+    settings = await get_email_settings(user_id)
+    subject, html_content = render_invoice_email(invoice, client, settings)
     
-    # Create email content
-    invoice_type = invoice.get("invoice_type", "invoice").title()
-    subject = f"{invoice_type} {invoice['invoice_number']} from IMAGICITY"
-    
-    html_content = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <style>
-            * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-            body {{ 
-                font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', Arial, sans-serif;
-                line-height: 1.6; 
-                color: #1f2937;
-                background-color: #f3f4f6;
-            }}
-            .email-wrapper {{ 
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                padding: 40px 20px;
-            }}
-            .email-container {{ 
-                max-width: 600px; 
-                margin: 0 auto; 
-                background: #ffffff;
-                border-radius: 16px;
-                overflow: hidden;
-                box-shadow: 0 20px 25px -5px rgba(0, 0, 0, 0.1), 0 10px 10px -5px rgba(0, 0, 0, 0.04);
-            }}
-            .header {{ 
-                background: linear-gradient(135deg, #ffffff 0%, #f9fafb 100%);
-                padding: 40px 30px;
-                text-align: center;
-                border-bottom: 4px solid #dc2626;
-            }}
-            .header img {{ 
-                max-width: 200px; 
-                height: auto; 
-                margin-bottom: 20px;
-            }}
-            .header h2 {{
-                font-size: 24px;
-                font-weight: 700;
-                color: #111827;
-                margin-bottom: 8px;
-            }}
-            .header .invoice-meta {{
-                display: inline-block;
-                background: #dc2626;
-                color: #ffffff;
-                padding: 8px 20px;
-                border-radius: 25px;
-                font-size: 14px;
-                font-weight: 600;
-                letter-spacing: 0.5px;
-            }}
-            .content {{ 
-                padding: 40px 30px;
-            }}
-            .greeting {{
-                font-size: 18px;
-                color: #111827;
-                font-weight: 600;
-                margin-bottom: 12px;
-            }}
-            .intro-text {{
-                color: #6b7280;
-                margin-bottom: 30px;
-                font-size: 15px;
-            }}
-            .card {{ 
-                background: #f9fafb;
-                border: 2px solid #e5e7eb;
-                border-radius: 12px;
-                padding: 20px;
-                margin: 20px 0;
-            }}
-            .card-title {{
-                font-size: 16px;
-                font-weight: 700;
-                color: #111827;
-                margin-bottom: 15px;
-                padding-bottom: 10px;
-                border-bottom: 2px solid #dc2626;
-                display: inline-block;
-            }}
-            .info-row {{
-                display: flex;
-                justify-content: space-between;
-                padding: 12px 0;
-                border-bottom: 1px solid #e5e7eb;
-            }}
-            .info-row:last-child {{ border-bottom: none; }}
-            .info-label {{ 
-                color: #6b7280;
-                font-size: 14px;
-                font-weight: 500;
-            }}
-            .info-value {{ 
-                color: #111827;
-                font-weight: 600;
-                font-size: 14px;
-            }}
-            .status-badge {{
-                display: inline-block;
-                padding: 4px 12px;
-                border-radius: 12px;
-                font-size: 12px;
-                font-weight: 600;
-                text-transform: uppercase;
-                background: #fef3c7;
-                color: #92400e;
-            }}
-            .table-container {{
-                overflow-x: auto;
-                margin: 25px 0;
-            }}
-            table {{ 
-                width: 100%; 
-                border-collapse: separate;
-                border-spacing: 0;
-                border-radius: 12px;
-                overflow: hidden;
-                border: 1px solid #e5e7eb;
-            }}
-            thead {{
-                background: linear-gradient(135deg, #f59e0b 0%, #d97706 100%);
-            }}
-            th {{ 
-                padding: 16px 12px;
-                text-align: left;
-                color: #111827;
-                font-weight: 700;
-                font-size: 13px;
-                text-transform: uppercase;
-                letter-spacing: 0.5px;
-            }}
-            td {{ 
-                padding: 16px 12px;
-                border-bottom: 1px solid #e5e7eb;
-                background: #ffffff;
-                font-size: 14px;
-            }}
-            tbody tr:last-child td {{ border-bottom: none; }}
-            tbody tr:hover td {{ background: #f9fafb; }}
-            .amount-col {{
-                text-align: right;
-                font-weight: 600;
-                color: #111827;
-            }}
-            .total-section {{
-                background: linear-gradient(135deg, #111827 0%, #374151 100%);
-                padding: 25px;
-                border-radius: 12px;
-                margin: 25px 0;
-                color: #ffffff;
-            }}
-            .total-row {{
-                display: flex;
-                justify-content: space-between;
-                padding: 10px 0;
-                font-size: 15px;
-            }}
-            .total-row.grand-total {{
-                padding-top: 15px;
-                margin-top: 15px;
-                border-top: 2px solid rgba(255, 255, 255, 0.3);
-                font-size: 24px;
-                font-weight: 700;
-            }}
-            .total-row.grand-total .amount {{
-                color: #fbbf24;
-            }}
-            .payment-card {{
-                background: linear-gradient(135deg, #dc2626 0%, #991b1b 100%);
-                color: #ffffff;
-                padding: 25px;
-                border-radius: 12px;
-                margin: 25px 0;
-            }}
-            .payment-card h3 {{
-                font-size: 18px;
-                margin-bottom: 20px;
-                font-weight: 700;
-            }}
-            .payment-detail {{
-                background: rgba(255, 255, 255, 0.1);
-                padding: 12px 16px;
-                border-radius: 8px;
-                margin-bottom: 12px;
-                display: flex;
-                justify-content: space-between;
-                align-items: center;
-            }}
-            .payment-detail:last-child {{ margin-bottom: 0; }}
-            .payment-label {{ 
-                font-size: 13px;
-                opacity: 0.9;
-                font-weight: 500;
-            }}
-            .payment-value {{ 
-                font-weight: 700;
-                font-size: 15px;
-                font-family: 'Courier New', monospace;
-            }}
-            .notes-section {{
-                background: #fffbeb;
-                border-left: 4px solid #f59e0b;
-                padding: 20px;
-                border-radius: 8px;
-                margin: 25px 0;
-            }}
-            .notes-section strong {{
-                color: #92400e;
-                display: block;
-                margin-bottom: 8px;
-                font-size: 14px;
-            }}
-            .cta-section {{
-                text-align: center;
-                padding: 30px 0;
-            }}
-            .cta-text {{
-                font-size: 16px;
-                color: #6b7280;
-                margin-bottom: 8px;
-            }}
-            .footer {{ 
-                background: #111827;
-                color: #9ca3af;
-                padding: 40px 30px;
-                text-align: center;
-            }}
-            .footer img {{
-                max-width: 150px;
-                height: auto;
-                margin-bottom: 20px;
-                filter: brightness(0) invert(1);
-            }}
-            .footer-text {{
-                font-size: 13px;
-                margin: 8px 0;
-                line-height: 1.8;
-            }}
-            .footer-divider {{
-                width: 60px;
-                height: 3px;
-                background: #dc2626;
-                margin: 20px auto;
-                border-radius: 2px;
-            }}
-            @media only screen and (max-width: 600px) {{
-                .email-wrapper {{ padding: 20px 10px; }}
-                .content {{ padding: 25px 20px; }}
-                .header {{ padding: 30px 20px; }}
-                th, td {{ padding: 12px 8px; font-size: 12px; }}
-                .total-row.grand-total {{ font-size: 20px; }}
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="email-wrapper">
-            <div class="email-container">
-                <div class="header">
-                    <img src="https://customer-assets.emergentagent.com/job_imagicity-manager/artifacts/8swu1bm6_SIDE%20ALLIGNED%20BLACK.png" alt="IMAGICITY">
-                    <h2>{invoice_type}</h2>
-                    <div class="invoice-meta">{invoice['invoice_number']}</div>
-                </div>
-                
-                <div class="content">
-                    <div class="greeting">Dear {client.get('business_name') or client.get('name')},</div>
-                    <p class="intro-text">Thank you for your business! Please find the details of your {invoice_type.lower()} below.</p>
-                    
-                    <div class="card">
-                        <div class="card-title">{invoice_type} Details</div>
-                        <div class="info-row">
-                            <span class="info-label">Invoice Number</span>
-                            <span class="info-value">{invoice['invoice_number']}</span>
-                        </div>
-                        <div class="info-row">
-                            <span class="info-label">Invoice Date</span>
-                            <span class="info-value">{invoice['invoice_date']}</span>
-                        </div>
-                        <div class="info-row">
-                            <span class="info-label">Due Date</span>
-                            <span class="info-value">{invoice['due_date']}</span>
-                        </div>
-                        <div class="info-row">
-                            <span class="info-label">Status</span>
-                            <span class="status-badge">{invoice['status']}</span>
-                        </div>
-                    </div>
-                    
-                    <div class="table-container">
-                        <table>
-                            <thead>
-                                <tr>
-                                    <th>Description</th>
-                                    <th style="text-align: center; width: 60px;">Qty</th>
-                                    <th style="text-align: right; width: 100px;">Rate</th>
-                                    <th style="text-align: right; width: 110px;">Amount</th>
-                                </tr>
-                            </thead>
-                            <tbody>
-                                {"".join([f"<tr><td style='color: #374151;'>{item['description']}</td><td style='text-align: center;'>{item['quantity']}</td><td class='amount-col'>₹{item['rate']:.2f}</td><td class='amount-col'>₹{item['amount']:.2f}</td></tr>" for item in invoice.get('items', [])])}
-                            </tbody>
-                        </table>
-                    </div>
-                    
-                    <div class="total-section">
-                        <div class="total-row">
-                            <span>Subtotal</span>
-                            <span class="amount">₹{invoice['subtotal']:.2f}</span>
-                        </div>
-                        <div class="total-row">
-                            <span>IGST (18%)</span>
-                            <span class="amount">₹{invoice['igst']:.2f}</span>
-                        </div>
-                        <div class="total-row grand-total">
-                            <span>Total Amount</span>
-                            <span class="amount">₹{invoice['total']:.2f}</span>
-                        </div>
-                    </div>
-                    
-                    <div class="payment-card">
-                        <h3>💳 Payment Details</h3>
-                        <div class="payment-detail">
-                            <span class="payment-label">Bank Name</span>
-                            <span class="payment-value">{settings.get('bank_name', 'N/A')}</span>
-                        </div>
-                        <div class="payment-detail">
-                            <span class="payment-label">Account Number</span>
-                            <span class="payment-value">{settings.get('account_number', 'N/A')}</span>
-                        </div>
-                        <div class="payment-detail">
-                            <span class="payment-label">IFSC Code</span>
-                            <span class="payment-value">{settings.get('ifsc_code', 'N/A')}</span>
-                        </div>
-                        <div class="payment-detail">
-                            <span class="payment-label">UPI ID</span>
-                            <span class="payment-value">{settings.get('upi_id', 'N/A')}</span>
-                        </div>
-                    </div>
-                    
-                    {f"<div class='notes-section'><strong>📝 Notes</strong><p style='color: #78350f; margin: 0;'>{invoice.get('notes')}</p></div>" if invoice.get('notes') else ""}
-                    
-                    <div class="cta-section">
-                        <p class="cta-text">Thank you for choosing IMAGICITY! 🙏</p>
-                    </div>
-                </div>
-                
-                <div class="footer">
-                    <img src="https://customer-assets.emergentagent.com/job_imagicity-manager/artifacts/8swu1bm6_SIDE%20ALLIGNED%20BLACK.png" alt="IMAGICITY">
-                    <div class="footer-divider"></div>
-                    <p class="footer-text">{settings.get('company_address', '')}</p>
-                    <p class="footer-text">GSTIN: {settings.get('company_gstin', '')} | Email: connect@imagicity.in</p>
-                    <p class="footer-text" style="margin-top: 20px; font-size: 11px; opacity: 0.7;">
-                        This is an automated email. Please do not reply to this message.
-                    </p>
-                </div>
-            </div>
-        </div>
-    </body>
-    </html>
-    """
-    
-    # Send email
-    await send_email_smtp(client['email'], subject, html_content)
+    # Deliver after the response is sent so SMTP latency stays off the request
+    background_tasks.add_task(send_email_smtp, client['email'], subject, html_content)
     
     return {
-        "message": f"Email sent successfully to {client['email']}",
+        "message": f"Email queued for delivery to {client['email']}",
         "recipient": client['email'],
         "invoice_number": invoice['invoice_number']
     }
 
+@api_router.post("/invoices/send-batch")
+async def send_invoice_emails_batch(batch: InvoiceEmailBatch, user_id: str = Depends(get_current_user)):
+    """Send several invoices over the shared SMTP connection"""
+    invoices = await db.invoices.find(
+        {"id": {"$in": batch.invoice_ids}, "user_id": user_id}, {"_id": 0}
+    ).to_list(len(batch.invoice_ids))
+    clients = await fetch_clients_by_id(user_id, (invoice["client_id"] for invoice in invoices))
+    settings = await get_email_settings(user_id)
+    
+    found_ids = {invoice["id"] for invoice in invoices}
+    sent = []
+    failed = [{"invoice_id": invoice_id, "error": "Invoice not found"} for invoice_id in batch.invoice_ids if invoice_id not in found_ids]
+    
+    for index, invoice in enumerate(invoices):
+        client = clients.get(invoice["client_id"])
+        if not client or not client.get("email"):
+            failed.append({"invoice_id": invoice["id"], "error": "Client email not found"})
+            continue
+        subject, html_content = render_invoice_email(invoice, client, settings)
+        try:
+            await smtp_client.send_message(build_email_message(client['email'], subject, html_content))
+            sent.append({"invoice_id": invoice["id"], "invoice_number": invoice["invoice_number"], "recipient": client['email']})
+            continue
+        except (aiosmtplib.SMTPConnectError, aiosmtplib.SMTPAuthenticationError, OSError) as e:
+            error = e
+        except aiosmtplib.SMTPException as e:
+            logger.error(f"Failed to send invoice {invoice['invoice_number']}: {str(e)}")
+            failed.append({"invoice_id": invoice["id"], "error": str(e)})
+            continue
+        # The server is unreachable, so every remaining send would fail the same way.
+        # Still report what already went out so a retry doesn't email those twice.
+        logger.error(f"Aborting email batch after {len(sent)} sent: {str(error)}")
+        failed.extend({"invoice_id": remaining["id"], "error": str(error)} for remaining in invoices[index:])
+        break
+    
+    return {
+        "message": f"Sent {len(sent)} of {len(batch.invoice_ids)} emails",
+        "sent": sent,
+        "failed": failed
+    }
+
 
 
 # Expense routes
@@ -868,36 +845,42 @@ async def send_invoice_email(invoice_id: str, user_id: str = Depends(get_current
 async def create_expense(expense_data: ExpenseCreate, user_id: str = Depends(get_current_user)):
     expense = Expense(**expense_data.model_dump(), user_id=user_id)
     expense_dict = expense.model_dump()
-    expense_dict['created_at'] = expense_dict['created_at'].isoformat()
     await db.expenses.insert_one(expense_dict)
+    invalidate_dashboard_stats(user_id)
     return expense
 
 @api_router.get("/expenses", response_model=List[Expense])
-async def get_expenses(user_id: str = Depends(get_current_user)):
-    expenses = await db.expenses.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
-    for expense in expenses:
-        if isinstance(expense.get('created_at'), str):
-            expense['created_at'] = datetime.fromisoformat(expense['created_at'])
-    return expenses
+async def get_expenses(
+    limit: int = Query(50, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    user_id: str = Depends(get_current_user),
+):
+    expenses = await db.expenses.find({"user_id": user_id}, {"_id": 0}).sort([("created_at", -1), ("id", -1)]).skip(offset).limit(limit).to_list(limit)
+    return Response(
+        EXPENSE_LIST_ADAPTER.dump_json(EXPENSE_LIST_ADAPTER.validate_python(expenses)),
+        media_type="application/json",
+    )
 
 @api_router.delete("/expenses/{expense_id}")
 async def delete_expense(expense_id: str, user_id: str = Depends(get_current_user)):
     result = await db.expenses.delete_one({"id": expense_id, "user_id": user_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Expense not found")
+    invalidate_dashboard_stats(user_id)
     return {"message": "Expense deleted successfully"}
 
 
 # Settings routes
 @api_router.get("/settings", response_model=Settings)
 async def get_settings(user_id: str = Depends(get_current_user)):
-    settings = await db.settings.find_one({"user_id": user_id}, {"_id": 0})
-    if not settings:
-        # Create default settings
-        new_settings = Settings(user_id=user_id)
-        settings_dict = new_settings.model_dump()
-        await db.settings.insert_one(settings_dict)
-        return new_settings
+    # Read, creating defaults on first access, in one atomic round trip
+    settings = await db.settings.find_one_and_update(
+        {"user_id": user_id},
+        {"$setOnInsert": Settings(user_id=user_id).model_dump()},
+        upsert=True,
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+    )
     return Settings(**settings)
 
 @api_router.put("/settings")
@@ -907,34 +890,51 @@ async def update_settings(settings_data: dict, user_id: str = Depends(get_curren
         {"$set": settings_data},
         upsert=True
     )
+    settings_cache.delete(user_id)
     return {"message": "Settings updated successfully"}
 
 
 # Dashboard stats
-@api_router.get("/dashboard/stats")
+@api_router.get("/dashboard/stats", response_class=ORJSONResponse)
 async def get_dashboard_stats(user_id: str = Depends(get_current_user)):
-    # Get all invoices
-    invoices = await db.invoices.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
-    
-    total_revenue = sum(inv['total'] for inv in invoices if inv['status'] == 'paid')
-    pending_amount = sum(inv['total'] for inv in invoices if inv['status'] == 'pending')
-    overdue_amount = sum(inv['total'] for inv in invoices if inv['status'] == 'overdue')
+    # Returned as ORJSONResponse directly so FastAPI skips its jsonable_encoder pass
+    cached = stats_cache.get(user_id)
+    if cached is not None:
+        return ORJSONResponse(cached)
     
-    # Get expenses
-    expenses = await db.expenses.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
-    total_expenses = sum(exp['amount'] for exp in expenses)
-    
-    # Get client count
-    client_count = await db.clients.count_documents({"user_id": user_id})
+    # Let Mongo do the summing so only a handful of scalars cross the wire
+    invoice_pipeline = [
+        {"$match": {"user_id": user_id}},
+        {"$group": {
+            "_id": None,
+            "total_revenue": {"$sum": {"$cond": [{"$eq": ["$status", "paid"]}, "$total", 0]}},
+            "pending_amount": {"$sum": {"$cond": [{"$eq": ["$status", "pending"]}, "$total", 0]}},
+            "overdue_amount": {"$sum": {"$cond": [{"$eq": ["$status", "overdue"]}, "$total", 0]}},
+            "invoice_count": {"$sum": 1},
+        }},
+    ]
+    expense_pipeline = [
+        {"$match": {"user_id": user_id}},
+        {"$group": {"_id": None, "total_expenses": {"$sum": "$amount"}}},
+    ]
+    invoice_totals, expense_totals, client_count = await asyncio.gather(
+        db.invoices.aggregate(invoice_pipeline).to_list(1),
+        db.expenses.aggregate(expense_pipeline).to_list(1),
+        db.clients.count_documents({"user_id": user_id}),
+    )
+    invoice_totals = invoice_totals[0] if invoice_totals else {}
+    expense_totals = expense_totals[0] if expense_totals else {}
     
-    return {
-        "total_revenue": total_revenue,
-        "pending_amount": pending_amount,
-        "overdue_amount": overdue_amount,
-        "total_expenses": total_expenses,
+    stats = {
+        "total_revenue": invoice_totals.get("total_revenue", 0),
+        "pending_amount": invoice_totals.get("pending_amount", 0),
+        "overdue_amount": invoice_totals.get("overdue_amount", 0),
+        "total_expenses": expense_totals.get("total_expenses", 0),
         "client_count": client_count,
-        "invoice_count": len(invoices)
+        "invoice_count": invoice_totals.get("invoice_count", 0)
     }
+    stats_cache.set(user_id, stats)
+    return ORJSONResponse(stats)
 
 
 app.include_router(api_router)
@@ -942,11 +942,78 @@ app.include_router(api_router)
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
+    allow_origins=CORS_ORIGINS,
     allow_methods=["*"],
     allow_headers=["*"],
+    max_age=86400,
 )
 
+@app.on_event("startup")
+async def warn_multi_worker_caches():
+    if WEB_CONCURRENCY > 1:
+        logger.warning(
+            f"WEB_CONCURRENCY={WEB_CONCURRENCY}: list, stats and settings caches are per process "
+            "and may serve stale data for up to their TTL after a write on another worker"
+        )
+
+@app.on_event("startup")
+async def warn_jwt_config():
+    if not os.environ.get("JWT_PRIVATE_KEY"):
+        logger.warning(
+            "JWT_PRIVATE_KEY is not set: the EdDSA signing key is derived from JWT_SECRET_KEY, "
+            "so anyone holding that secret can mint tokens. Generate an Ed25519 keypair and set it."
+        )
+    if LEGACY_TOKEN_CUTOFF is None:
+        logger.warning("JWT_LEGACY_CUTOFF is not set: HS256 tokens are accepted until their own expiry")
+    elif LEGACY_TOKEN_CUTOFF <= utcnow():
+        logger.warning("JWT_LEGACY_CUTOFF has passed: every HS256 token has expired and the HS256 path can be removed")
+
+@app.on_event("startup")
+async def warm_db_pool():
+    try:
+        await db.command("ping")
+    except Exception as e:
+        # Don't refuse to boot while Mongo is unreachable; the pool fills on first use
+        logger.error(f"Failed to reach MongoDB at startup: {str(e)}")
+
+@app.on_event("startup")
+async def create_indexes():
+    async def ensure_index(collection: str, keys, **kwargs):
+        try:
+            await db[collection].create_index(keys, **kwargs)
+        except Exception as e:
+            # Don't refuse to boot over an index; queries still work, just slower.
+            # Each index is tried on its own so one failure (e.g. duplicate emails
+            # blocking the unique email index) doesn't skip the rest.
+            logger.error(f"Failed to create index {keys} on {collection}: {str(e)}")
+
+    await ensure_index("users", "email", unique=True)
+    await ensure_index("users", "id", unique=True)
+    for collection in ("clients", "services", "invoices", "expenses"):
+        await ensure_index(collection, [("user_id", 1), ("id", 1)], unique=True)
+        # id breaks created_at ties so limit/offset pages never overlap or skip rows
+        await ensure_index(collection, [("user_id", 1), ("created_at", -1), ("id", -1)])
+    await ensure_index("invoices", [("user_id", 1), ("status", 1)])
+    # reserve_invoice_number's DuplicateKeyError retry relies on this being unique
+    await ensure_index("settings", "user_id", unique=True)
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
+    bcrypt_pool.shutdown(wait=False)
+    await smtp_client.close()
+
+
+if __name__ == "__main__":
+    import uvicorn
+    # A single worker by default because the write-invalidated caches are in-process;
+    # uvloop and httptools replace the pure-Python event loop and HTTP parser
+    uvicorn.run(
+        "server:app",
+        host="0.0.0.0",
+        port=int(os.environ.get("PORT", 8001)),
+        workers=WEB_CONCURRENCY,
+        loop="uvloop",
+        http="httptools",
+        limit_concurrency=1000,
+    )
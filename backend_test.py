@@ -1,59 +1,78 @@
 import requests
+from requests.adapters import HTTPAdapter
 import sys
 import json
+import orjson
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
+# Concurrent cleanup threads; the session's connection pool is sized to match
+CLEANUP_WORKERS = 16
+
 class ImagicityAPITester:
     def __init__(self, base_url="https://imagicity-manager.preview.emergentagent.com/api"):
         self.base_url = base_url
+        # Endpoints are appended to this prefix rather than formatted per call
+        self._url = base_url.rstrip('/') + '/'
         self.token = None
         self.user_id = None
         self.tests_run = 0
         self.tests_passed = 0
+        self.counter_lock = threading.Lock()
+        # One session keeps the TCP/TLS connection alive across all requests
+        self.session = requests.Session()
+        self.session.headers.update({'Content-Type': 'application/json'})
+        # The default pool keeps only 10 connections, which would discard the extras under cleanup
+        adapter = HTTPAdapter(pool_maxsize=CLEANUP_WORKERS)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
         self.created_resources = {
             'clients': [],
             'invoices': [],
             'expenses': []
         }
 
-    def run_test(self, name, method, endpoint, expected_status, data=None, headers=None):
-        """Run a single API test"""
-        url = f"{self.base_url}/{endpoint}"
-        test_headers = {'Content-Type': 'application/json'}
-        if self.token:
-            test_headers['Authorization'] = f'Bearer {self.token}'
-        if headers:
-            test_headers.update(headers)
-
-        self.tests_run += 1
-        print(f"\n🔍 Testing {name}...")
-        print(f"   URL: {url}")
+    def set_token(self, token):
+        self.token = token
+        self.session.headers['Authorization'] = f'Bearer {token}'
+
+    def run_test(self, name, method, endpoint, expected_status, data=None, headers=None, output=None):
+        """Run a single API test; pass a list as output to collect its log lines instead of printing"""
+        log = print if output is None else output.append
+        url = self._url + endpoint
+
+        with self.counter_lock:
+            self.tests_run += 1
+        log(f"\n🔍 Testing {name}...")
+        log(f"   URL: {url}")
         
         try:
             if method == 'GET':
-                response = requests.get(url, headers=test_headers, timeout=10)
+                response = self.session.get(url, headers=headers, timeout=10)
             elif method == 'POST':
-                response = requests.post(url, json=data, headers=test_headers, timeout=10)
+                response = self.session.post(url, json=data, headers=headers, timeout=10)
             elif method == 'PUT':
-                response = requests.put(url, json=data, headers=test_headers, timeout=10)
+                response = self.session.put(url, json=data, headers=headers, timeout=10)
             elif method == 'DELETE':
-                response = requests.delete(url, headers=test_headers, timeout=10)
+                response = self.session.delete(url, headers=headers, timeout=10)
 
             success = response.status_code == expected_status
             if success:
-                self.tests_passed += 1
-                print(f"✅ Passed - Status: {response.status_code}")
+                with self.counter_lock:
+                    self.tests_passed += 1
+                log(f"✅ Passed - Status: {response.status_code}")
                 try:
-                    return True, response.json() if response.content else {}
+                    return True, orjson.loads(response.content) if response.content else {}
                 except:
                     return True, {}
             else:
-                print(f"❌ Failed - Expected {expected_status}, got {response.status_code}")
-                print(f"   Response: {response.text[:200]}")
+                log(f"❌ Failed - Expected {expected_status}, got {response.status_code}")
+                log(f"   Response: {response.text[:200]}")
                 return False, {}
 
         except Exception as e:
-            print(f"❌ Failed - Error: {str(e)}")
+            log(f"❌ Failed - Error: {str(e)}")
             return False, {}
 
     def test_root_endpoint(self):
@@ -70,7 +89,7 @@ class ImagicityAPITester:
             data={"email": email, "password": password, "name": name}
         )
         if success and 'access_token' in response:
-            self.token = response['access_token']
+            self.set_token(response['access_token'])
             self.user_id = response['user']['id']
             print(f"   Token obtained: {self.token[:20]}...")
             return True
@@ -86,7 +105,7 @@ class ImagicityAPITester:
             data={"email": email, "password": password}
         )
         if success and 'access_token' in response:
-            self.token = response['access_token']
+            self.set_token(response['access_token'])
             self.user_id = response['user']['id']
             print(f"   Token obtained: {self.token[:20]}...")
             return True
@@ -182,6 +201,51 @@ class ImagicityAPITester:
         """Test get all invoices"""
         return self.run_test("Get Invoices", "GET", "invoices", 200)
 
+    def test_send_invoice_batch(self):
+        """Test batch email sending without emailing anyone"""
+        success, response = self.run_test(
+            "Send Invoice Batch (unknown id)",
+            "POST",
+            "invoices/send-batch",
+            200,
+            data={"invoice_ids": ["missing-invoice"]}
+        )
+        if success and [failure['invoice_id'] for failure in response.get('failed', [])] != ["missing-invoice"]:
+            print("   ⚠️ Unknown invoice was not reported as failed")
+            return False
+        self.run_test(
+            "Send Invoice Batch (too large)",
+            "POST",
+            "invoices/send-batch",
+            422,
+            data={"invoice_ids": [f"invoice-{i}" for i in range(101)]}
+        )
+        return success
+
+    def test_get_invoices_summary(self):
+        """Test invoice list with the summary projection"""
+        success, response = self.run_test("Get Invoices (summary)", "GET", "invoices?summary=true", 200)
+        if success and any('items' in invoice for invoice in response):
+            print("   ⚠️ Summary response still includes line items")
+            return False
+        return success
+
+    def test_get_invoices_expanded(self, client_id):
+        """Test invoice list with embedded clients"""
+        success, response = self.run_test("Get Invoices (expand=client)", "GET", "invoices?expand=client", 200)
+        if success and not any((invoice.get('client') or {}).get('id') == client_id for invoice in response):
+            print("   ⚠️ Expanded response is missing the invoice's client")
+            return False
+        return success
+
+    def test_get_invoices_page(self):
+        """Test invoice list pagination"""
+        success, response = self.run_test("Get Invoices (limit/offset)", "GET", "invoices?limit=1&offset=0", 200)
+        if success and len(response) > 1:
+            print(f"   ⚠️ Expected at most 1 invoice, got {len(response)}")
+            return False
+        return success
+
     def test_get_invoice(self, invoice_id):
         """Test get single invoice"""
         return self.run_test("Get Single Invoice", "GET", f"invoices/{invoice_id}", 200)
@@ -238,17 +302,23 @@ class ImagicityAPITester:
         """Clean up created test resources"""
         print("\n🧹 Cleaning up test resources...")
         
-        # Delete expenses
-        for expense_id in self.created_resources['expenses']:
-            self.run_test(f"Delete Expense {expense_id}", "DELETE", f"expenses/{expense_id}", 200)
+        deletions = (
+            [(f"Delete Expense {expense_id}", f"expenses/{expense_id}") for expense_id in self.created_resources['expenses']]
+            + [(f"Delete Invoice {invoice_id}", f"invoices/{invoice_id}") for invoice_id in self.created_resources['invoices']]
+            + [(f"Delete Client {client_id}", f"clients/{client_id}") for client_id in self.created_resources['clients']]
+        )
         
-        # Delete invoices
-        for invoice_id in self.created_resources['invoices']:
-            self.run_test(f"Delete Invoice {invoice_id}", "DELETE", f"invoices/{invoice_id}", 200)
+        def delete(deletion):
+            output = []
+            self.run_test(deletion[0], "DELETE", deletion[1], 200, output=output)
+            return output
         
-        # Delete clients
-        for client_id in self.created_resources['clients']:
-            self.run_test(f"Delete Client {client_id}", "DELETE", f"clients/{client_id}", 200)
+        # Deletes are independent, so issue them concurrently instead of one round trip at a time;
+        # each one's log lines are printed afterwards so they don't interleave
+        with ThreadPoolExecutor(max_workers=CLEANUP_WORKERS) as executor:
+            outputs = list(executor.map(delete, deletions))
+        for output in outputs:
+            print("\n".join(output))
 
 def main():
     print("🚀 Starting Imagicity Invoice API Tests")
@@ -299,7 +369,11 @@ def main():
             invoice_id = tester.test_create_invoice(client_id)
             if invoice_id:
                 tester.test_get_invoices()
+                tester.test_get_invoices_summary()
+                tester.test_get_invoices_expanded(client_id)
+                tester.test_get_invoices_page()
                 tester.test_get_invoice(invoice_id)
+                tester.test_send_invoice_batch()
 
         # Test expense management
         print("\n💰 Testing Expense Management...")
@@ -16,10 +16,10 @@ export const Dashboard = () => {
     try {
       const [statsRes, invoicesRes] = await Promise.all([
         api.get('/dashboard/stats'),
-        api.get('/invoices'),
+        api.get('/invoices', { params: { summary: true, limit: 5 } }),
       ]);
       setStats(statsRes.data);
-      setRecentInvoices(invoicesRes.data.slice(0, 5));
+      setRecentInvoices(invoicesRes.data);
     } catch (error) {
       console.error('Error fetching dashboard data:', error);
     } finally {
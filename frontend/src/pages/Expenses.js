@@ -24,7 +24,7 @@ export const Expenses = () => {
 
   const fetchExpenses = async () => {
     try {
-      const response = await api.get('/expenses');
+      const response = await api.get('/expenses', { params: { limit: 1000 } });
       setExpenses(response.data);
     } catch (error) {
       toast.error('Failed to fetch expenses');
@@ -41,7 +41,7 @@ export const Invoices = () => {
   const fetchData = async () => {
     try {
       const [invoicesRes, clientsRes, servicesRes, settingsRes] = await Promise.all([
-        api.get('/invoices'),
+        api.get('/invoices', { params: { limit: 1000 } }),
         api.get('/clients'),
         api.get('/services'),
         api.get('/settings'),